@@ -1,54 +1,107 @@
 import csv
-import json
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
 
+import lxml.html
+import orjson
 import requests
-from bs4 import BeautifulSoup
+import urllib3
+from lxml.etree import XPath
+from lxml.html import HtmlElement
 from pptx import Presentation
 from pptx.dml.color import RGBColor
 from pptx.enum.shapes import MSO_AUTO_SHAPE_TYPE
 from pptx.enum.text import PP_ALIGN
-from pptx.opc.constants import RELATIONSHIP_TYPE
+from pptx.opc.constants import CONTENT_TYPE, RELATIONSHIP_TYPE
+from pptx.opc.packuri import PackURI
+from pptx.oxml.slide import CT_Slide
+from pptx.parts.slide import SlidePart
 from pptx.shapes.placeholder import Shape
-from pptx.slide import Slide
+from pptx.slide import Slide, SlideLayout
 from pptx.util import Inches
-
-
-def fetch_page(url):
-    """Fetches the HTML content of the given URL."""
+from requests.adapters import HTTPAdapter
+
+THEME_XT_XP_PATTERN = re.compile(r"^(.*?)\s*\(xT\s*=\s*([\d.]+),\s*xP\s*=\s*([\d.]+)\)")
+PARTE_PATTERN = re.compile(r"^Parte\s\d\s")
+NUMBER_PATTERN = re.compile(r"\d+")
+BR_PATTERN = re.compile(r"<br\s*/?>", re.IGNORECASE)
+
+# Quiz rows are "<b>player - team</b><br>theme (xT = ..., xP = ...)<br>...<br>...<b>points</b>",
+# with the question in the first <i> and the answer in the <i> following <b>Resposta</b>.
+# Line breaks are matched anywhere in the row, in document order, as rows may be wrapped in an element.
+# Plain strings are returned so the parsed rows aren't kept alive by the extracted text.
+HAS_LINE_BREAK = XPath("boolean(.//br)", smart_strings=False)
+PLAYER_XPATH = XPath("string(((.//br)[1]/preceding::b)[1])", smart_strings=False)
+THEME_XPATH = XPath("(.//br)[1]/following::text()[count(preceding::br) = 1]", smart_strings=False)
+POINTS_XPATH = XPath("string(((.//br)[last()]/following::b)[1])", smart_strings=False)
+QUESTION_XPATH = XPath("string((.//i)[1])", smart_strings=False)
+ANSWER_XPATH = XPath('string(.//b[. = "Resposta"]/following::i[1])', smart_strings=False)
+
+# lxml holds a parser's lock for a whole streamed parse, so each fetch thread keeps its own parser
+THREAD_LOCAL = threading.local()
+
+MAX_FETCH_WORKERS = 16
+
+# Shared across fetches so connections are kept alive and reused
+SESSION = requests.Session()
+SESSION.headers.update({"User-Agent": "Mozilla/5.0"})
+# Keep one pooled connection per fetch worker instead of urllib3's default of 10
+SESSION.mount("https://", HTTPAdapter(pool_maxsize=MAX_FETCH_WORKERS))
+SESSION.mount("http://", HTTPAdapter(pool_maxsize=MAX_FETCH_WORKERS))
+
+
+def fetch_page(url, session: requests.Session = SESSION):
+    """Fetches the given URL, parsing its HTML content as the response is streamed."""
     try:
-        response = requests.get(url, headers={"User-Agent": "Mozilla/5.0"})
-        response.raise_for_status()  # Raise an error for bad status codes
-        response.encoding = "utf-8"
-        return response.text
-    except requests.exceptions.RequestException as e:
+        with session.get(url, timeout=10, stream=True) as response:
+            response.raise_for_status()  # Raise an error for bad status codes
+            response.raw.decode_content = True  # Let urllib3 undo any content encoding
+            tree = lxml.html.parse(response.raw, get_html_parser())
+    except (requests.exceptions.RequestException, urllib3.exceptions.HTTPError) as e:
         print(f"Error fetching page: {e}")
         return None
+    if tree.getroot() is None:  # Empty or whitespace-only body
+        return None
+    return tree
+
 
+def get_html_parser():
+    """Returns the calling thread's HTML parser, creating it on first use."""
+    if not hasattr(THREAD_LOCAL, "html_parser"):
+        # Quiz pages are served as UTF-8, so there's no need for lxml to guess the encoding
+        THREAD_LOCAL.html_parser = lxml.html.HTMLParser(encoding="utf-8", remove_blank_text=True)
+    return THREAD_LOCAL.html_parser
 
-def parse_html(html):
-    """Parses the HTML content using BeautifulSoup."""
-    return BeautifulSoup(html, "html.parser", from_encoding="latin-1")
 
+def parse_html(tree):
+    """Returns the root element of the parsed HTML document."""
+    return tree.getroot()
 
-def extract_page_title(soup: BeautifulSoup):
+
+def extract_page_title(root: HtmlElement):
     """Extracts and cleans the page title."""
-    title_tag = soup.find("title")
-    if not title_tag:
+    title = root.findtext(".//title")
+    if not title:
         return ""
 
-    title = title_tag.get_text().strip()
-    return title
+    return title.strip()
 
 
-def find_jf_game(soup: BeautifulSoup):
-    for div_container in soup.find_all("div", class_="level3"):
-        script_tag = div_container.find("script", type="application/json")
-        if not script_tag:
+def find_jf_game(root: HtmlElement):
+    script_texts = []
+    for div_container in root.xpath('.//div[contains(concat(" ", normalize-space(@class), " "), " level3 ")]'):
+        script_tag = div_container.find('.//script[@type="application/json"]')
+        if script_tag is not None and script_tag.text:
+            script_texts.append(script_tag.text)
+    for script_text in script_texts:
+        # Cheap check on the raw text, so other games' data is never decoded
+        if "Figueiras" not in script_text:
             continue
         try:
-            whole_json = json.loads(script_tag.string)
-        except json.JSONDecodeError:
+            whole_json = orjson.loads(script_text)
+        except orjson.JSONDecodeError:
             continue
         try:
             title: str = whole_json["x"]["layout"]["title"]["text"]
@@ -57,11 +110,17 @@ def find_jf_game(soup: BeautifulSoup):
         if "José Figueiras" in title:
             return whole_json
     print("Did not find José Figueiras.")
-    return whole_json
+    # Fall back to the last game on the page
+    for script_text in reversed(script_texts):
+        try:
+            return orjson.loads(script_text)
+        except orjson.JSONDecodeError:
+            continue
+    return None
 
 
-def extract_quiz_data(soup: BeautifulSoup):
-    whole_json = find_jf_game(soup)
+def extract_quiz_data(root: HtmlElement):
+    whole_json = find_jf_game(root)
     if not whole_json:
         print("No matching div with target title found.")
         return []
@@ -72,48 +131,47 @@ def extract_quiz_data(soup: BeautifulSoup):
         print(f"Error parsing JSON: {e}")
         return []
 
+    # Local aliases, as these are looked up for every row
+    fragment_fromstring = lxml.html.fragment_fromstring
+    space_line_breaks = BR_PATTERN.sub
+    search_theme_xt_xp = THEME_XT_XP_PATTERN.search
+    remove_parte = PARTE_PATTERN.sub
+    has_line_break = HAS_LINE_BREAK
+    find_player = PLAYER_XPATH
+    find_points = POINTS_XPATH
+    find_theme = THEME_XPATH
+    find_question = QUESTION_XPATH
+    find_answer = ANSWER_XPATH
+
     parsed_data = []
     for part in quiz_data:
         part_data = []
         if "text" not in part:
             continue
+        add_question = part_data.append
         for row in part["text"]:
-            soup_text = BeautifulSoup(row, "html.parser")
-            parts = re.split(r"<br\s*/>", str(soup_text))
-            if len(parts) < 2:
+            # Put a space before each line break so the extracted text doesn't run lines together
+            fragment = fragment_fromstring(space_line_breaks(r" \g<0>", row), create_parent="div")
+            if not has_line_break(fragment):
                 continue
-            player_tag = parts[0].strip()
-            player_soup = BeautifulSoup(player_tag, "html.parser")
-            b_tag = player_soup.find("b")
-            if b_tag:
-                full_name_and_team = b_tag.get_text(strip=True)
-                player_name = full_name_and_team.split(" - ")[0]
-            final_part = parts[-1].strip()
-            final_soup = BeautifulSoup(final_part, "html.parser")
-            points_tag = final_soup.find("b")
-
-            if points_tag:
-                points = points_tag.get_text(strip=True)
-            theme_xt_xp = parts[1].strip()
-            pattern = re.compile(r"^(.*?)\s*\(xT\s*=\s*([\d.]+),\s*xP\s*=\s*([\d.]+)\)")
-            match = pattern.search(theme_xt_xp)
+            full_name_and_team = find_player(fragment).strip()
+            player_name = full_name_and_team.split(" - ")[0]
+            points = find_points(fragment).strip()
+            theme_xt_xp = "".join(find_theme(fragment)).strip()
+            match = search_theme_xt_xp(theme_xt_xp)
             if match:
                 theme = match.group(1).strip()
                 # Remove "Parte X " from theme if present
-                theme = re.sub(r"^Parte\s\d\s", "", theme).strip()
+                theme = remove_parte("", theme, count=1).strip()
                 xt = float(match.group(2))
                 xp = float(match.group(3))
             else:
                 continue
-            for br in soup_text.find_all("br"):
-                br.replace_with(" ")
             # Extract question
-            question_tag = soup_text.find("i")
-            question = question_tag.get_text() if question_tag else ""
+            question = find_question(fragment)
             # Extract answer
-            answer_tag = soup_text.find("b", string="Resposta")
-            answer = answer_tag.find_next("i").get_text() if answer_tag else ""
-            part_data.append(
+            answer = find_answer(fragment)
+            add_question(
                 {
                     "theme": theme,
                     "xT": xt,
@@ -129,10 +187,15 @@ def extract_quiz_data(soup: BeautifulSoup):
 
 
 def sort_quiz_data(parsed_data):
-    """Sorts each part of quiz data alphabetically by theme, except themes starting with 'Mystery Box' come last."""
+    """Sorts each part of quiz data alphabetically by theme, except themes starting with 'Mystery Box' come last.
+
+    Also returns the unique themes of each part, in that same order.
+    """
+    themes_by_part = []
     for part in parsed_data:
         part.sort(key=lambda x: (x["theme"].startswith("Mystery Box"), x["theme"]))
-    return parsed_data
+        themes_by_part.append(list(dict.fromkeys(row["theme"] for row in part)))
+    return parsed_data, themes_by_part
 
 
 # Load CSV file and extract data
@@ -143,60 +206,82 @@ def load_csv(filename):
     return data
 
 
-# Extract unique themes and sort them as specified
-def get_sorted_themes(data):
-    return sorted(set(row["theme"] for row in data), key=lambda x: (x.startswith("Mystery Box"), x))
+# Add a slide from a copy of a blank slide's XML, skipping python-pptx's placeholder cloning.
+# slide_number is the new slide's 1-based position, so no existing slide list has to be rescanned.
+def clone_slide(prs, slide_layout: SlideLayout, template: CT_Slide, slide_number: int):
+    slide_part = SlidePart(
+        partname=PackURI(f"/ppt/slides/slide{slide_number}.xml"),
+        content_type=CONTENT_TYPE.PML_SLIDE,
+        package=prs.part.package,
+        element=deepcopy(template),
+    )
+    slide_part.relate_to(slide_layout.part, RELATIONSHIP_TYPE.SLIDE_LAYOUT)
+    rId = prs.part.relate_to(slide_part, RELATIONSHIP_TYPE.SLIDE)
+    # Slide ids start at 256
+    prs.slides._sldIdLst._add_sldId(id=255 + slide_number, rId=rId)
+    return slide_part.slide
 
 
 # Create PowerPoint presentation
-def create_ppt(data, output_file):
+def create_ppt(data, themes, output_file):
     left = top = width = height = Inches(0.75)
     prs = Presentation()
 
     # Generate index slide
     slide_layout = prs.slide_layouts[1]
     home_slide = prs.slides.add_slide(slide_layout)
+    slide_template = deepcopy(home_slide._element)
     title = home_slide.shapes.title
     title.text = output_file
 
-    themes = get_sorted_themes(data)
     theme_to_first_question_slide = {}
+    bottom = prs.slide_height - top
+    footer_width = prs.slide_width - 4 * width
+    button_left = prs.slide_width - left
 
-    # Generate slides for each question
+    # Generate question and answer slides for each row in a single pass
     question_slides = []
-    for row in data:
-        slide = prs.slides.add_slide(slide_layout)
+    for i, row in enumerate(data):
+        # the index slide is slide 1, followed by each question and its answer
+        question_slide = clone_slide(prs, slide_layout, slide_template, 2 * i + 2)
         # title
-        title = slide.shapes.title
+        title = question_slide.shapes.title
         title.text = row["theme"]
         # question
-        body_shape: Shape = slide.shapes.placeholders[1]
+        body_shape: Shape = question_slide.shapes.placeholders[1]
         tf = body_shape.text_frame
         tf.clear()
         tf.text = row["question"]
 
         if row["theme"] not in theme_to_first_question_slide:
-            theme_to_first_question_slide[row["theme"]] = slide
-        question_slides.append(slide)
+            theme_to_first_question_slide[row["theme"]] = question_slide
+        question_slides.append(question_slide)
 
-        slide = prs.slides.add_slide(slide_layout)
+        answer_slide = clone_slide(prs, slide_layout, slide_template, 2 * i + 3)
         # title
-        title = slide.shapes.title
+        title = answer_slide.shapes.title
         title.text = row["theme"]
         # answer
-        body_shape: Shape = slide.shapes.placeholders[1]
+        body_shape: Shape = answer_slide.shapes.placeholders[1]
         tf = body_shape.text_frame
         tf.text = row["answer"]
         # footer with xP
-        footer = slide.shapes.add_textbox(left * 2, prs.slide_height - top, prs.slide_width - 4 * width, height)
+        footer = answer_slide.shapes.add_textbox(left * 2, bottom, footer_width, height)
         footer.text_frame.text = f"xP: {row['xP']}"
         footer.text_frame.paragraphs[0].alignment = PP_ALIGN.CENTER
         footer.text_frame.paragraphs[0].font.color.rgb = RGBColor.from_string("c0c0c0")
 
+        # all slides have button back to the index slide
+        for slide in (question_slide, answer_slide):
+            home_button = slide.shapes.add_shape(
+                MSO_AUTO_SHAPE_TYPE.ACTION_BUTTON_HOME, button_left, bottom, width, height
+            )
+            home_button.click_action.target_slide = home_slide
+
     # Add hyperlinks from the index slide to the first question slide of each theme
+    index_shape: Shape = home_slide.shapes.placeholders[1]
     for i, theme in enumerate(themes, 1):
         theme_slide: Slide = theme_to_first_question_slide[theme]
-        index_shape: Shape = home_slide.shapes.placeholders[1]
         rId = home_slide.part.relate_to(theme_slide.part, RELATIONSHIP_TYPE.SLIDE)
         p = index_shape.text_frame.add_paragraph()
         r = p.add_run()
@@ -205,42 +290,34 @@ def create_ppt(data, output_file):
         hlinkClick = rPr.add_hlinkClick(rId)
         hlinkClick.set("action", "ppaction://hlinksldjump")
 
-    for i, slide in enumerate(prs.slides):
-        if i == 0:
-            continue
-        # all slides have button back to the index slide
-        home_button = slide.shapes.add_shape(
-            MSO_AUTO_SHAPE_TYPE.ACTION_BUTTON_HOME, prs.slide_width - left, prs.slide_height - top, width, height
-        )
-        home_button.click_action.target_slide = home_slide
-
     # Save presentation
     prs.save(f"{output_file}.pptx")
     print(f"Presentation saved as {output_file}")
 
 
 def print_json(content: dict, filename: str):
-    with open(filename, "w") as json_file:
-        json.dump(content, json_file, indent=2)
+    with open(filename, "wb") as json_file:
+        json_file.write(orjson.dumps(content, option=orjson.OPT_INDENT_2))
 
 
 def main():
     urls = ["https://quizportugal.pt/sites/default/files/pictures/QNpt15_7.html#jam-37-x-38-jfg"]
-    for url in urls:
-        html_content = fetch_page(url)
-        if html_content:
-            soup = parse_html(html_content)
-            page_title = extract_page_title(soup)
-            quiz_data = extract_quiz_data(soup)
-            sorted_data = sort_quiz_data(quiz_data)
-            season, week = [int(n) for n in re.findall(r"\d+", page_title)]
+    with ThreadPoolExecutor(max_workers=max(1, min(len(urls), MAX_FETCH_WORKERS))) as executor:
+        trees = list(executor.map(fetch_page, urls))
+    for tree in trees:
+        if tree is not None:
+            root = parse_html(tree)
+            page_title = extract_page_title(root)
+            quiz_data = extract_quiz_data(root)
+            sorted_data, themes_by_part = sort_quiz_data(quiz_data)
+            season, week = [int(n) for n in NUMBER_PATTERN.findall(page_title)]
             quiz = {"season": season, "week": week}
             parts = []
-            for i, part_data in enumerate(sorted_data, 1):
+            for i, (part_data, part_themes) in enumerate(zip(sorted_data, themes_by_part), 1):
                 ppt_filename = f"{page_title} - Parte {i}"
-                themes = [theme for theme in get_sorted_themes(part_data) if not theme.startswith("Mystery Box")]
+                themes = [theme for theme in part_themes if not theme.startswith("Mystery Box")]
                 parts.append({"sequence": i, "themes": themes, "questions": part_data})
-                create_ppt(part_data, ppt_filename)
+                create_ppt(part_data, part_themes, ppt_filename)
             quiz["parts"] = parts
             print_json(quiz, f"{page_title}.json")
 